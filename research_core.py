@@ -0,0 +1,600 @@
+"""Research pipeline shared by the Streamlit entry points app.py and streamlit_app.py."""
+
+import os
+import re
+import asyncio
+import time
+import hashlib
+import tempfile
+import itertools
+import threading
+import diskcache
+import faiss
+import httpx
+import numpy as np
+import openai
+import orjson
+import streamlit as st
+from aiolimiter import AsyncLimiter
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai._models import construct_type  # private helper; keep openai pinned in requirements.txt
+from openai.types.responses import Response
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+# Models and tools identical to original script
+MODEL = "gpt-4.1"
+MODEL_MINI = "gpt-4.1-mini"
+TOOLS = [{"type": "web_search_preview"}]
+
+# Structured output formats, so the plan and the follow-up queries always parse
+QUERIES_SCHEMA = {"type": "array", "items": {"type": "string"}, "minItems": 5, "maxItems": 5}
+PLAN_FORMAT = {
+    "type": "json_schema",
+    "name": "plan",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {"goal": {"type": "string"}, "queries": QUERIES_SCHEMA},
+        "required": ["goal", "queries"],
+        "additionalProperties": False,
+    },
+}
+QUERIES_FORMAT = {
+    "type": "json_schema",
+    "name": "queries",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {"queries": QUERIES_SCHEMA},
+        "required": ["queries"],
+        "additionalProperties": False,
+    },
+}
+
+# Numbered items of a reply ("1.", "2)", "**3.**"), continued by indented lines only
+QUESTION_RE = re.compile(r"^[ \t]*(\*\*)?\d+[.)](\*\*)?[ \t]+(\S.*(?:\n[ \t]+\S.*)*)", re.M)
+
+# Upper bound on concurrent web searches, keeps a round under the rate limit
+MAX_CONCURRENCY = 5
+
+# Connection pool of the shared client, reused across reruns
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+
+# API calls are throttled to this rate and retried on these errors
+REQUESTS_PER_MINUTE = 500
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)
+
+# Seconds between status checks of a low-cost batch job
+BATCH_POLL_INTERVAL = 30
+
+# On-disk cache of Responses API results, reused for a week
+CACHE_DIR = ".llm_cache"
+CACHE_TTL = 7 * 24 * 60 * 60
+
+# Web searches whose query embedding is this close to a previous one reuse it
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+SEMANTIC_CACHE_DIR = ".semantic_cache"
+SEMANTIC_THRESHOLD = 0.92
+
+# System / developer message
+DEVELOPER_MESSAGE = (
+    "You are an expert Deep Researcher.\n"
+    "You provide complete and in depth research to the user."
+)
+
+# ----------------------------- Helper Functions ----------------------------- #
+
+
+@st.cache_resource
+def get_openai_client(api_key: str) -> AsyncOpenAI:
+    """Return the pooled async OpenAI client of a key, shared across reruns."""
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=DefaultAsyncHttpxClient(limits=HTTP_LIMITS),
+        max_retries=0,  # retries are handled by call_api
+    )
+
+
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop shared by all script reruns."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def run_async(coro):
+    """Run a coroutine on the shared event loop and block for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def iter_async(agen):
+    """Iterate an async generator on the shared event loop, e.g. for st.write_stream."""
+    loop = get_event_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        # Also runs when the script stops mid-stream, so the generator's cleanup runs too
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+def first_text(resp: Response) -> str:
+    """Return the first output text of a response, skipping tool call items."""
+    return next(
+        (c.text for item in resp.output for c in getattr(item, "content", None) or []
+         if getattr(c, "type", None) == "output_text"),
+        "",
+    )
+
+
+@st.cache_resource
+def get_rate_limiter() -> AsyncLimiter:
+    """Return the requests-per-minute limiter shared by all sessions."""
+    return AsyncLimiter(REQUESTS_PER_MINUTE, 60)
+
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(min=1, max=30),
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    reraise=True,
+)
+async def call_api(method, *args, **params):
+    """Await an OpenAI client method within the rate limit, retrying transient errors."""
+    async with get_rate_limiter():
+        return await method(*args, **params)
+
+
+@st.cache_resource
+def get_response_cache() -> diskcache.Cache:
+    """Return the persistent cache of Responses API results."""
+    return diskcache.Cache(CACHE_DIR)
+
+
+def load_response(data: dict) -> Response:
+    """Rebuild a Response as leniently as the SDK builds live ones."""
+    return construct_type(type_=Response, value=data)
+
+
+def cache_key(client: AsyncOpenAI, params: dict) -> str:
+    """Return the cache key of a Responses API call for this account."""
+    payload = orjson.dumps({"api_key": client.api_key, **params}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+
+async def cached_create(client: AsyncOpenAI, **params) -> Response:
+    """Call ``client.responses.create``, answering repeated calls from cache."""
+    cache = get_response_cache()
+    key = cache_key(client, params)
+    cached = cache.get(key)
+    if cached is not None:
+        return load_response(orjson.loads(cached))
+    resp = await call_api(client.responses.create, **params)
+    if resp.status == "completed":
+        cache.set(key, resp.model_dump_json(), expire=CACHE_TTL)
+    return resp
+
+
+async def cached_stream(client: AsyncOpenAI, **params):
+    """Yield the output text of a streamed call, sharing ``cached_create``'s cache."""
+    cache = get_response_cache()
+    key = cache_key(client, params)
+    cached = cache.get(key)
+    if cached is not None:
+        yield first_text(load_response(orjson.loads(cached)))
+        return
+    stream = await call_api(client.responses.create, stream=True, **params)
+    try:
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+            elif event.type == "response.completed" and event.response.status == "completed":
+                cache.set(key, event.response.model_dump_json(), expire=CACHE_TTL)
+    finally:
+        await stream.close()
+
+
+class SemanticCache:
+    """Web search records indexed by the cosine similarity of their query."""
+
+    def __init__(self, path: str, dim: int = EMBEDDING_DIM, ttl: int = CACHE_TTL):
+        self.path = path
+        self.index_path = os.path.join(path, "index.faiss")
+        self.records_path = os.path.join(path, "records.json")
+        self.dim = dim
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.index, self.records = self.load()
+
+    def load(self):
+        """Return the persisted index and records, or empty ones if unusable."""
+        try:
+            index = faiss.read_index(self.index_path)
+            with open(self.records_path, "rb") as f:
+                records = orjson.loads(f.read())
+        except (OSError, RuntimeError, orjson.JSONDecodeError):
+            return faiss.IndexFlatIP(self.dim), []
+        if index.ntotal != len(records):
+            return faiss.IndexFlatIP(self.dim), []
+        return index, records
+
+    def lookup(self, vector: np.ndarray, threshold: float = SEMANTIC_THRESHOLD):
+        """Return the record of the most similar query, if similar enough."""
+        with self.lock:
+            self._evict_expired()
+            if not self.records:
+                return None
+            scores, ids = self.index.search(vector, 1)
+            if scores[0][0] < threshold:
+                return None
+            return self.records[ids[0][0]]
+
+    async def add(self, vector: np.ndarray, record: dict):
+        """Index a new record under its query vector and persist off the loop."""
+        with self.lock:
+            self._evict_expired()
+            self.index.add(vector)
+            self.records.append({**record, "created": time.time()})
+        await asyncio.to_thread(self.save)
+
+    def _evict_expired(self):
+        # Records are appended in time order, so the expired ones are a prefix
+        cutoff = time.time() - self.ttl
+        stale = 0
+        while stale < len(self.records) and self.records[stale].get("created", 0) < cutoff:
+            stale += 1
+        if stale:
+            self.index.remove_ids(np.arange(stale, dtype="int64"))
+            self.records = self.records[stale:]
+
+    def clear(self):
+        """Drop every record and persist the empty index."""
+        with self.lock:
+            self.index.reset()
+            self.records = []
+        self.save()
+
+    def save(self):
+        """Atomically write a consistent snapshot of the index and records."""
+        with self.save_lock:
+            with self.lock:
+                index_bytes = faiss.serialize_index(self.index).tobytes()
+                records_bytes = orjson.dumps(self.records)
+            self._write(self.index_path, index_bytes)
+            self._write(self.records_path, records_bytes)
+
+    def _write(self, target: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+
+
+@st.cache_resource
+def get_semantic_cache() -> SemanticCache:
+    """Return the persistent semantic cache of web search records."""
+    return SemanticCache(SEMANTIC_CACHE_DIR)
+
+
+async def embed(client: AsyncOpenAI, text: str) -> np.ndarray:
+    """Return the normalised embedding of ``text`` as a 1×dim float32 array."""
+    resp = await call_api(client.embeddings.create, model=EMBEDDING_MODEL, input=text)
+    vector = np.array([resp.data[0].embedding], dtype="float32")
+    faiss.normalize_L2(vector)
+    return vector
+
+
+def parse_questions(text: str) -> list[str]:
+    """Return up to 5 numbered questions of a reply, unwrapping long lines."""
+    questions = []
+    for m in QUESTION_RE.finditer(text):
+        question = " ".join(m.group(3).split())
+        if m.group(1) and not m.group(2) and question.endswith("**"):
+            question = question[:-2].rstrip()  # "**1. question**"
+        elif question.startswith("**") and question.endswith("**"):
+            question = question[2:-2].strip()  # "1. **question**"
+        questions.append(question)
+    return questions[:5]
+
+
+async def ask_clarifying_questions(client: AsyncOpenAI, topic: str):
+    """Return 5 clarifying questions and the response id used to generate them."""
+    prompt = (
+        f"Ask 5 numbered clarifying questions about the topic of research: {topic}. "
+        "The goal of the questions is to understand the intented purpose of the research. "
+        "Reply only with the questions."
+    )
+    clarify = await cached_create(
+        client,
+        model=MODEL_MINI,
+        input=prompt,
+        instructions=DEVELOPER_MESSAGE,
+    )
+    questions = parse_questions(first_text(clarify))
+    if len(questions) != 5:
+        clarify = await cached_create(
+            client,
+            model=MODEL_MINI,
+            input=prompt + (
+                " Write exactly 5 questions, each on its own line as \"1. question\", "
+                "with no text before or after them."
+            ),
+            instructions=DEVELOPER_MESSAGE,
+        )
+        questions = parse_questions(first_text(clarify))
+    if not questions:
+        # Fall back to one question per non-empty line, as before
+        questions = [q.strip() for q in first_text(clarify).split("\n") if q.strip()]
+    if not questions:
+        raise RuntimeError("The model did not return any clarifying questions")
+    return questions, clarify.id
+
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def clarify_cached(_client: AsyncOpenAI, api_key: str, topic: str):
+    """Memoise the clarifying questions of a topic for this account."""
+    return run_async(ask_clarifying_questions(_client, topic))
+
+
+def clear_caches():
+    """Empty the response, semantic and clarifying question caches."""
+    get_response_cache().clear()
+    get_semantic_cache().clear()
+    clarify_cached.clear()
+
+
+async def create_plan(client: AsyncOpenAI, topic: str, questions: list[str], answers: list[str], prev_id: str):
+    """Generate goal sentence and 5 web search queries."""
+    prompt = (
+        f"Using the user answers {answers} to the {questions}, write a goal sentence and 5 web searches "
+        f"queries for the research about {topic} \n"
+        "Output: A json list of the goal and the 5 web queries that will reach it.\n"
+        "Format: {\"goal\": \"...\", \"queries\": [\"q1\", ....]}"
+    )
+    resp = await cached_create(
+        client,
+        model=MODEL,
+        input=prompt,
+        previous_response_id=prev_id,
+        instructions=DEVELOPER_MESSAGE,
+        text={"format": PLAN_FORMAT},
+    )
+    plan = orjson.loads(first_text(resp))
+    return plan["goal"], plan["queries"], resp.id
+
+
+def normalize(query: str) -> str:
+    """Return the canonical form of a query used to spot duplicates."""
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+def unique_queries(queries: list[str], seen: set[str], limit: int = 5) -> list[str]:
+    """Return up to ``limit`` queries not yet in ``seen`` and record them."""
+    fresh = []
+    for q in queries:
+        key = normalize(q)
+        if key in seen:
+            continue
+        seen.add(key)
+        fresh.append(q)
+        if len(fresh) == limit:
+            break
+    return fresh
+
+
+def search_params(query: str, prev_id: str) -> dict:
+    """Return the Responses API parameters of a single web search."""
+    return {
+        "model": MODEL,
+        "input": f"search: {query}",
+        "previous_response_id": prev_id,
+        "instructions": DEVELOPER_MESSAGE,
+        "tools": TOOLS,
+    }
+
+
+async def run_search(client: AsyncOpenAI, query: str, prev_id: str):
+    """Perform a single web search query and return record with ids."""
+    semantic_cache = get_semantic_cache()
+    vector = await embed(client, normalize(query))
+    hit = semantic_cache.lookup(vector)
+    if hit is not None:
+        return {"query": query, "resp_id": hit["resp_id"]}
+
+    search_resp = await cached_create(client, **search_params(query, prev_id))
+    record = {"query": query, "resp_id": first_text(search_resp)}
+    if record["resp_id"]:
+        await semantic_cache.add(vector, record)
+    return record
+
+
+async def submit_batch(client: AsyncOpenAI, queries: list[str], prev_id: str):
+    """Run the uncached web searches as one Batch API job and return all records."""
+    cache = get_response_cache()
+    semantic_cache = get_semantic_cache()
+    records = {}
+    pending = {}
+    for idx, q in enumerate(queries):
+        cached = cache.get(cache_key(client, search_params(q, prev_id)))
+        if cached is not None:
+            records[idx] = {"query": q, "resp_id": first_text(load_response(orjson.loads(cached)))}
+        else:
+            pending[idx] = q
+    if not pending:
+        return [records[idx] for idx in sorted(records)]
+
+    lines = [
+        orjson.dumps({
+            "custom_id": str(idx),
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": search_params(q, prev_id),
+        })
+        for idx, q in pending.items()
+    ]
+    # Remember the job, so a rerun resumes polling instead of paying again
+    batch_key = cache_key(client, {"batch": [line.decode() for line in lines]})
+    batch_id = cache.get(batch_key)
+    if batch_id is None:
+        batch_file = await call_api(
+            client.files.create,
+            file=("searches.jsonl", b"\n".join(lines)),
+            purpose="batch",
+        )
+        batch = await call_api(
+            client.batches.create,
+            input_file_id=batch_file.id,
+            endpoint="/v1/responses",
+            completion_window="24h",
+        )
+        cache.set(batch_key, batch.id, expire=CACHE_TTL)
+    else:
+        batch = await call_api(client.batches.retrieve, batch_id)
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        batch = await call_api(client.batches.retrieve, batch.id)
+    if batch.status != "completed":
+        cache.delete(batch_key)
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+    if batch.output_file_id:
+        output = await call_api(client.files.content, batch.output_file_id)
+        for line in output.content.splitlines():
+            row = orjson.loads(line)
+            if not row.get("response") or row["response"]["status_code"] != 200:
+                continue
+            idx = int(row["custom_id"])
+            search_resp = load_response(row["response"]["body"])
+            record = {"query": pending[idx], "resp_id": first_text(search_resp)}
+            records[idx] = record
+            if search_resp.status == "completed":
+                cache.set(cache_key(client, search_params(pending[idx], prev_id)),
+                          search_resp.model_dump_json(), expire=CACHE_TTL)
+            if record["resp_id"]:
+                vector = await embed(client, normalize(pending[idx]))
+                await semantic_cache.add(vector, record)
+
+    if not records:
+        cache.delete(batch_key)
+        detail = "no output"
+        if batch.error_file_id:
+            errors = await call_api(client.files.content, batch.error_file_id)
+            rows = errors.content.splitlines()
+            if rows:
+                row = orjson.loads(rows[0])
+                detail = row.get("error") or (row.get("response") or {}).get("body", {}).get("error")
+        raise RuntimeError(f"Batch {batch.id} returned no successful searches: {detail}")
+    return [records[idx] for idx in sorted(records)]
+
+
+def research_context(goal: str, collected: list[dict]) -> list[dict]:
+    """Return the goal and the latest round of collected data as messages."""
+    return [
+        {"role": "developer", "content": f"Research goal: {goal}"},
+        {"role": "assistant", "content": f"New data: {orjson.dumps(collected).decode()}"},
+    ]
+
+
+async def evaluate_progress(client: AsyncOpenAI, goal: str, collected: list[dict], prev_id: str):
+    """Return whether the new records satisfy the goal, and the response id."""
+    review = await cached_create(
+        client,
+        model=MODEL_MINI,
+        input=research_context(goal, collected) + [
+            {"role": "user", "content": "Does this information answer the research goal? Answer Yes or No only"},
+        ],
+        instructions=DEVELOPER_MESSAGE,
+        previous_response_id=prev_id,
+        max_output_tokens=16,  # smallest limit the API accepts
+    )
+    return "yes" in first_text(review).lower(), review.id
+
+
+async def request_more_queries(client: AsyncOpenAI, goal: str, collected: list[dict], prev_id: str):
+    """Return 5 alternative queries towards the goal and the response id."""
+    more = await cached_create(
+        client,
+        model=MODEL_MINI,
+        input=research_context(goal, collected) + [
+            {"role": "user", "content": (
+                f"If this has not met the goal: {goal}. Write 5 other web searchs to achieve the goal\n"
+                "Output: A json object with the 5 web queries.\n"
+                "Format: {\"queries\": [\"q1\", ....]}"
+            )},
+        ],
+        instructions=DEVELOPER_MESSAGE,
+        previous_response_id=prev_id,
+        text={"format": QUERIES_FORMAT},
+    )
+    return orjson.loads(first_text(more))["queries"], more.id
+
+
+async def conduct_research(client: AsyncOpenAI, goal: str, queries: list[str], prev_id: str,
+                           max_concurrency: int = MAX_CONCURRENCY, low_cost: bool = False):
+    """Iteratively search until goal is satisfied, mirroring notebook flow."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded_search(q: str):
+        async with semaphore:
+            return await run_search(client, q, prev_id)
+
+    collected = []
+    seen: set[str] = set()
+    found: set[str] = set()
+    thread_id = prev_id
+    for _ in itertools.count():
+        queries = unique_queries(queries, seen)
+        if not queries:
+            break  # nothing left that has not been searched already
+        if low_cost:
+            results = await submit_batch(client, queries, prev_id)
+        else:
+            results = await asyncio.gather(*(bounded_search(q) for q in queries))
+        new_records = []
+        for record in results:
+            if record["resp_id"] not in found:
+                found.add(record["resp_id"])
+                new_records.append(record)
+        collected.extend(new_records)
+        eval_task = asyncio.create_task(
+            evaluate_progress(client, goal, new_records, thread_id))
+        # Ask for 5 alternative queries in case more data is needed
+        more_task = asyncio.create_task(
+            request_more_queries(client, goal, new_records, thread_id))
+        try:
+            done, review_id = await eval_task
+            if not done:
+                queries, thread_id = await more_task
+        finally:
+            if not more_task.done():
+                more_task.cancel()
+            elif not more_task.cancelled():
+                more_task.exception()  # mark a failed speculative call as retrieved
+        if done:
+            thread_id = review_id
+            break
+    return collected, thread_id
+
+
+def generate_final_report_stream(client: AsyncOpenAI, goal: str, queries: list[str], prev_id: str):
+    """Ask LLM to compile the final deep-research report, as an async generator of its text."""
+    return cached_stream(
+        client,
+        model=MODEL,
+        input=[
+            {"role": "developer", "content": (
+                f"Write a complete and detail report about research goal: {goal} "
+                f"using the data gathered for the web searches {queries}. "
+                "Cite Sources inline using [n] and append a reference list mapping [n] to url"
+            )},
+        ],
+        instructions=DEVELOPER_MESSAGE,
+        previous_response_id=prev_id,
+    )